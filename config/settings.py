@@ -1,6 +1,9 @@
 import datetime
+import functools
 import logging
 import os
+import socket
+import time
 from zoneinfo import ZoneInfo
 from dotenv import load_dotenv
 
@@ -10,6 +13,11 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
+@functools.lru_cache(maxsize=8)
+def _format_epoch_second(epoch_second, tz, fmt):
+    """Format waktu dengan granularitas 1 detik; hasil di-cache per (detik, tz, format)"""
+    return datetime.datetime.fromtimestamp(epoch_second, tz).strftime(fmt)
+
 class TemperatureMonitorConfig:
     """Class untuk mengelola konfigurasi aplikasi"""
     
@@ -17,6 +25,9 @@ class TemperatureMonitorConfig:
         # MQTT Configuration
         self.MQTT_BROKER = os.getenv("MQTT_BROKER")
         self.MQTT_PORT = 1883
+        # Persistent session + QoS 1: broker menyimpan pesan selama koneksi terputus lalu mengirim ulang
+        self.MQTT_CLIENT_ID = os.getenv("MQTT_CLIENT_ID") or self._default_mqtt_client_id()
+        self.MQTT_QOS = 1
         self.MQTT_TOPICS = {
             "dryer1": os.getenv("MQTT_TOPIC_1"),
             "dryer2": os.getenv("MQTT_TOPIC_2"),
@@ -37,14 +48,19 @@ class TemperatureMonitorConfig:
         
         # Time and Temperature Configuration
         self.DATA_SAVE_INTERVAL = 600  # 10 menit
+        # Offset kalibrasi ditambahkan sekali saat data MQTT diterima; nilai di database sudah terkoreksi
         self.TEMPERATURE_OFFSET = 12.6
         self.INDONESIA_TZ = ZoneInfo("Asia/Jakarta")
+        self.INDONESIA_TZ_NAME = str(self.INDONESIA_TZ)
         self.MIN_TEMP_ALERT = float(120)
         self.MAX_TEMP_ALERT = float(155)
         
         # Database Configuration
         self.DB_PATH = "/data/data_suhu_multi.db" if os.path.exists("/data") else "data_suhu_multi.db"
         
+        # Session Configuration (opsional: server-side session di Redis)
+        self.REDIS_URL = os.getenv("REDIS_URL")
+        
         self.validate()
         
     def validate(self):
@@ -55,24 +71,33 @@ class TemperatureMonitorConfig:
             
         logger.info(f"Config loaded - Broker: {self.MQTT_BROKER}")
 
+    @staticmethod
+    def _default_mqtt_client_id():
+        """Client id stabil per deployment: app + machine di Fly.io, hostname di tempat lain.
+        Client id yang sama di dua proses membuat broker saling memutus session (clean_session=False)"""
+        fly_app, fly_machine = os.getenv("FLY_APP_NAME"), os.getenv("FLY_MACHINE_ID")
+        if fly_app and fly_machine:
+            return f"temperature-monitor-{fly_app}-{fly_machine}"
+        return f"temperature-monitor-{socket.gethostname()}"
+
     def get_indonesia_time(self):
         """Get current time in Indonesia timezone"""
         return datetime.datetime.now(self.INDONESIA_TZ)
 
+    def format_indonesia_date(self, dt=None):
+        """Format tanggal (YYYY-MM-DD) untuk filter data per hari (tanggal hari ini di-cache per detik)"""
+        if dt is None:
+            return _format_epoch_second(int(time.time()), self.INDONESIA_TZ, "%Y-%m-%d")
+        return dt.strftime("%Y-%m-%d")
+
     def format_indonesia_time(self, dt=None):
-        """Format time in Indonesian format with timezone"""
+        """Format time in Indonesian format with timezone (waktu sekarang di-cache per detik)"""
         if dt is None:
-            dt = self.get_indonesia_time()
+            return _format_epoch_second(int(time.time()), self.INDONESIA_TZ, "%Y-%m-%d %H:%M:%S %Z")
         return dt.strftime("%Y-%m-%d %H:%M:%S %Z")
 
     def format_indonesia_time_simple(self, dt=None):
-        """Format time in simple format without timezone for database"""
+        """Format time in simple format without timezone for database (waktu sekarang di-cache per detik)"""
         if dt is None:
-            dt = self.get_indonesia_time()
-        return dt.strftime("%Y-%m-%d %H:%M:%S")
-
-    def apply_temperature_offset(self, raw_temp):
-        """Apply consistent temperature offset"""
-        if raw_temp is None:
-            return None
-        return raw_temp + self.TEMPERATURE_OFFSET
\ No newline at end of file
+            return _format_epoch_second(int(time.time()), self.INDONESIA_TZ, "%Y-%m-%d %H:%M:%S")
+        return dt.strftime("%Y-%m-%d %H:%M:%S")
\ No newline at end of file
@@ -1,9 +1,15 @@
 import threading
 import logging
+import orjson
 import os
-from queue import Queue
-from flask import Flask
+import tempfile
+from collections import deque
+from flask import Flask, request, redirect, url_for
+from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
 from flask_login import LoginManager
+from jinja2 import FileSystemBytecodeCache
+from werkzeug.middleware.proxy_fix import ProxyFix
 from datetime import timedelta
 
 from config.settings import TemperatureMonitorConfig
@@ -11,7 +17,10 @@ from database.manager import DatabaseManager
 from services.mqtt_service import MQTTService
 from services.telegram_service import TelegramService
 from tasks.data_save_task import DataSaveTask
+from tasks.db_maintenance_task import DatabaseMaintenanceTask
 from tasks.excel_report_task import DailyExcelReportTask
+from tasks.keepalive_task import KeepaliveTask
+from tasks.monitor_data_task import MonitorDataTask
 from web.routes import WebRoutes
 
 logger = logging.getLogger(__name__)
@@ -29,6 +38,8 @@ class TemperatureMonitor:
             "boiler": {"boiler1": None, "boiler2": None}
         }
         
+        # latest_temperatures tidak pernah dimutasi, hanya diganti utuh oleh writer.
+        # data_lock hanya menserialisasi writer; pembaca tidak perlu lock.
         self.data_lock = threading.Lock()
         
         # Alert status untuk semua sistem
@@ -38,12 +49,27 @@ class TemperatureMonitor:
             "boiler1": "NORMAL", "boiler2": "NORMAL"
         }
         
+        # Mapping topic -> device dibangun sekali, bukan per pesan MQTT
+        self._topic_mapping = self._build_topic_mapping()
+        
         # Initialize components
         self.db_manager = DatabaseManager(self.config.DB_PATH)
         self.telegram_service = TelegramService(self.config, self.db_manager)
         self.mqtt_service = MQTTService(self.config, self._on_mqtt_message)
         self.tasks = []
-        self.notification_queue = Queue()
+        
+        # SSE fan-out: satu payload bersama untuk /stream-data,
+        # ring buffer notifikasi bersama untuk /stream-notifications
+        self._sse_cond = threading.Condition()
+        self._sse_latest_payload = None
+        self._sse_seq = 0
+        self._notification_cond = threading.Condition()
+        self._notification_ring = deque(maxlen=1024)
+        self._notification_seq = 0
+        # Di-set saat shutdown agar generator SSE (/stream-data, /stream-notifications) selesai
+        self._shutdown_event = threading.Event()
+        self._services_stopped = False
+        self.publish_stream_data()
     
     def _on_mqtt_message(self, raw_temperature, topic):
         """Callback untuk setiap pesan MQTT. Memproses suhu dan mengirim notifikasi."""
@@ -52,37 +78,42 @@ class TemperatureMonitor:
             return
         
         system_type, device_id = device_info
-        adjusted_temperature = self.config.apply_temperature_offset(raw_temperature)
+        # Offset kalibrasi diterapkan sekali di sini; nilai yang disimpan/ditampilkan sudah terkoreksi
+        adjusted_temperature = raw_temperature + self.config.TEMPERATURE_OFFSET
         
-        # Update memory
+        # Nilai sama dengan yang sudah ada: snapshot, SSE, dan status alert tidak akan berubah
+        if self.latest_temperatures[system_type].get(device_id) == adjusted_temperature:
+            return
+        
+        # Update memory (copy-on-write: pembaca cukup mengambil referensi snapshot tanpa lock)
         with self.data_lock:
-            self.latest_temperatures[system_type][device_id] = adjusted_temperature
+            snapshot = dict(self.latest_temperatures)
+            snapshot[system_type] = {**snapshot[system_type], device_id: adjusted_temperature}
+            self.latest_temperatures = snapshot
+        self.publish_stream_data()
         
-        logger.info(f"Data {{{device_id}}} diterima: {adjusted_temperature:.2f}°C")
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(f"Data {{{device_id}}} diterima: {adjusted_temperature:.2f}°C")
         
         # Check alerts and send notifications
         self._check_temperature_alerts(device_id, adjusted_temperature)
     
+    def _build_topic_mapping(self):
+        """Bangun mapping topic MQTT -> (system_type, device_id) sekali saat inisialisasi"""
+        topic_mapping = {}
+        for system_type, devices in self.latest_temperatures.items():
+            for device_id in devices:
+                topic = self.config.MQTT_TOPICS.get(device_id)
+                if topic:
+                    topic_mapping[topic] = (system_type, device_id)
+        return topic_mapping
+    
     def _get_device_info_from_topic(self, topic):
         """Extract device info from MQTT topic"""
-        topic_mapping = {
-            # Dryer topics
-            self.config.MQTT_TOPICS.get("dryer1"): ("dryer", "dryer1"),
-            self.config.MQTT_TOPICS.get("dryer2"): ("dryer", "dryer2"),
-            self.config.MQTT_TOPICS.get("dryer3"): ("dryer", "dryer3"),
-            # Kedi topics
-            self.config.MQTT_TOPICS.get("kedi1"): ("kedi", "kedi1"),
-            self.config.MQTT_TOPICS.get("kedi2"): ("kedi", "kedi2"),
-            # Boiler topics
-            self.config.MQTT_TOPICS.get("boiler1"): ("boiler", "boiler1"),
-            self.config.MQTT_TOPICS.get("boiler2"): ("boiler", "boiler2"),
-        }
-        
-        return topic_mapping.get(topic)
+        return self._topic_mapping.get(topic)
     
     def _check_temperature_alerts(self, device_id, temperature):
         """Check temperature alerts dan kirim notifikasi jika diperlukan"""
-        waktu_kejadian = self.config.format_indonesia_time()
         telegram_message = None
         notification_payload = None
         
@@ -92,7 +123,7 @@ class TemperatureMonitor:
                 title = f"🔥 Suhu Tinggi ({device_id.upper()})"
                 message = f"Suhu mencapai {temperature:.1f}°C, melebihi batas normal {self.config.MAX_TEMP_ALERT}°C."
                 
-                telegram_message = f"*{title}*\n\n🌡️ Suhu: *{temperature:.1f}°C*\n🕒 Waktu: {waktu_kejadian}"
+                telegram_message = f"*{title}*\n\n🌡️ Suhu: *{temperature:.1f}°C*\n🕒 Waktu: {self.config.format_indonesia_time()}"
                 notification_payload = {"title": title, "message": message}
                 self.alert_status[device_id] = 'HIGH'
         
@@ -102,7 +133,7 @@ class TemperatureMonitor:
                 title = f"❄️ Suhu Rendah ({device_id.upper()})"
                 message = f"Suhu turun menjadi {temperature:.1f}°C, di bawah batas normal {self.config.MIN_TEMP_ALERT}°C."
                 
-                telegram_message = f"*{title}*\n\n🌡️ Suhu: *{temperature:.1f}°C*\n🕒 Waktu: {waktu_kejadian}"
+                telegram_message = f"*{title}*\n\n🌡️ Suhu: *{temperature:.1f}°C*\n🕒 Waktu: {self.config.format_indonesia_time()}"
                 notification_payload = {"title": title, "message": message}
                 self.alert_status[device_id] = 'LOW'
         
@@ -118,23 +149,79 @@ class TemperatureMonitor:
                 self.telegram_service.send_message(telegram_message)
         
         if notification_payload:
-            self.notification_queue.put(notification_payload)
+            self.publish_notification(notification_payload)
     
     def get_latest_temperatures(self):
-        """Mendapatkan semua suhu terbaru dari memori"""
-        with self.data_lock:
-            return self.latest_temperatures.copy()
+        """Mendapatkan snapshot read-only semua suhu terbaru dari memori"""
+        return self.latest_temperatures
+    
+    def publish_stream_data(self):
+        """Serialize suhu terbaru sekali dan bangunkan klien /stream-data jika nilainya berubah"""
+        data_payload = {
+            device_id: f"{temp:.1f}" if temp is not None else "N/A"
+            for devices in self.latest_temperatures.values()
+            for device_id, temp in devices.items()
+        }
+        frame = b"data: " + orjson.dumps(data_payload) + b"\n\n"
+        
+        with self._sse_cond:
+            if frame == self._sse_latest_payload:
+                return
+            self._sse_latest_payload = frame
+            self._sse_seq += 1
+            self._sse_cond.notify_all()
+    
+    def get_stream_payload(self):
+        """Frame SSE suhu terakhir (None jika belum ada data); dikirim ulang sebagai heartbeat saat nilai stabil"""
+        return self._sse_latest_payload
+    
+    def is_shutting_down(self):
+        """True setelah begin_shutdown; loop SSE berhenti saat ini True"""
+        return self._shutdown_event.is_set()
+    
+    def begin_shutdown(self):
+        """Tandai shutdown dan bangunkan semua klien SSE yang sedang menunggu agar koneksinya selesai"""
+        self._shutdown_event.set()
+        for cond in (self._sse_cond, self._notification_cond):
+            with cond:
+                cond.notify_all()
+    
+    def wait_stream_data(self, last_seq, timeout=None):
+        """Tunggu payload SSE yang lebih baru dari last_seq. Return (seq, payload atau None jika timeout/shutdown)"""
+        with self._sse_cond:
+            if not self._sse_cond.wait_for(lambda: self._sse_seq != last_seq or self.is_shutting_down(), timeout):
+                return last_seq, None
+            if self._sse_seq == last_seq:
+                return last_seq, None
+            return self._sse_seq, self._sse_latest_payload
+    
+    def get_notification_seq(self):
+        """Nomor urut notifikasi terakhir; klien baru mulai membaca setelah nomor ini"""
+        return self._notification_seq
+    
+    def wait_notifications(self, last_seq, timeout=None):
+        """Tunggu notifikasi setelah last_seq. Return (seq, list frame; kosong jika timeout)"""
+        with self._notification_cond:
+            if not self._notification_cond.wait_for(lambda: self._notification_seq != last_seq or self.is_shutting_down(), timeout):
+                return last_seq, []
+            frames = [frame for seq, frame in self._notification_ring if seq > last_seq]
+            return self._notification_seq, frames
+    
+    def publish_notification(self, notification_payload):
+        """Encode notifikasi sekali lalu bagikan ke semua klien lewat ring buffer"""
+        frame = b"data: " + orjson.dumps(notification_payload) + b"\n\n"
+        with self._notification_cond:
+            self._notification_seq += 1
+            self._notification_ring.append((self._notification_seq, frame))
+            self._notification_cond.notify_all()
     
     def start_background_tasks(self):
         """Memulai semua background tasks"""
-        # Import tasks yang diperlukan
-        from tasks.keepalive_task import KeepaliveTask
-        from tasks.monitor_data_task import MonitorDataTask
-        
         self.tasks.append(DataSaveTask(self.config, self, self.db_manager))
         self.tasks.append(DailyExcelReportTask(self.config, self.db_manager, self.telegram_service))
         self.tasks.append(KeepaliveTask(self.config))
         self.tasks.append(MonitorDataTask(self.config, self.db_manager, self.telegram_service))
+        self.tasks.append(DatabaseMaintenanceTask(self.db_manager))
         
         for task in self.tasks:
             task.start()
@@ -143,6 +230,9 @@ class TemperatureMonitor:
     
     def stop_background_tasks(self):
         """Stop semua background tasks"""
+        # Sinyal stop ke semua task dulu agar join berjalan paralel, bukan 5 detik per task berurutan
+        for task in self.tasks:
+            task.request_stop()
         for task in self.tasks:
             task.stop()
         logger.info("All background tasks stopped")
@@ -151,15 +241,37 @@ class TemperatureMonitor:
         """Create dan configure Flask application"""
         app = Flask(__name__, template_folder='../templates', static_folder='../static')
         app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'default-secret-key-for-dev')
+        # Aplikasi berjalan di belakang proxy Fly.io; ambil IP klien dari X-Forwarded-For
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=1, x_proto=1)
+        
+        # Template dikompilasi sekali dan bytecode-nya disimpan di disk
+        app.config['TEMPLATES_AUTO_RELOAD'] = False
+        jinja_cache_dir = os.path.join(tempfile.gettempdir(), "jinja-cache")
+        os.makedirs(jinja_cache_dir, exist_ok=True)
+        app.jinja_env.auto_reload = False
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(jinja_cache_dir)
         
         # Session configuration
         app.config.update(
             PERMANENT_SESSION_LIFETIME=timedelta(hours=24),
+            SESSION_REFRESH_EACH_REQUEST=False,
             SESSION_COOKIE_HTTPONLY=True,
             SESSION_COOKIE_SECURE=False,
             SESSION_COOKIE_SAMESITE='Lax'
         )
         
+        # Server-side session di Redis jika tersedia, cookie hanya berisi session id
+        if self.config.REDIS_URL:
+            import redis
+            from flask_session import Session
+            app.config.update(
+                SESSION_TYPE='redis',
+                SESSION_REDIS=redis.from_url(self.config.REDIS_URL),
+                SESSION_KEY_PREFIX='suhu_session:'
+            )
+            Session(app)
+            logger.info("Server-side session menggunakan Redis")
+        
         # Setup Flask-Login
         login_manager = LoginManager()
         login_manager.init_app(app)
@@ -172,47 +284,57 @@ class TemperatureMonitor:
         
         @login_manager.unauthorized_handler
         def unauthorized():
-            from flask import request, redirect, url_for
             if request.endpoint != 'login':
                 return redirect(url_for('login', next=request.url))
             return redirect(url_for('login'))
         
+        # Rate limiter (dipakai untuk /login); storage di Redis jika tersedia
+        limiter = Limiter(get_remote_address, app=app, storage_uri=self.config.REDIS_URL or "memory://")
+        
         # Register routes
-        web_routes = WebRoutes(self.config, self.db_manager, self)
+        web_routes = WebRoutes(self.config, self.db_manager, self, limiter)
         web_routes.register_routes(app)
         
         return app
     
-    def run(self):
-        """Run the complete monitoring system"""
-        # Create initial admin user
+    def create_initial_user(self):
+        """Membuat admin user awal dari environment variables"""
         admin_user = os.getenv('ADMIN_USER')
         admin_pass = os.getenv('ADMIN_PASSWORD')
         if admin_user and admin_pass:
             self.db_manager.create_initial_user(admin_user, admin_pass)
         else:
             logger.warning("ADMIN_USER dan ADMIN_PASSWORD tidak diatur.")
-        
+    
+    def start_services(self):
+        """Start MQTT, Telegram (worker + polling) dan background tasks tanpa memblokir thread pemanggil"""
+        self.create_initial_user()
+        self.mqtt_service.connect()
+        self.telegram_service.start_worker()
+        self.start_background_tasks()
+        self.telegram_service.start_polling()
+    
+    def stop_services(self):
+        """Stop semua service yang dijalankan oleh start_services (aman dipanggil lebih dari sekali)"""
+        if self._services_stopped:
+            return
+        self._services_stopped = True
+        self.begin_shutdown()
+        self.stop_background_tasks()
+        self.telegram_service.stop_polling()
+        self.telegram_service.stop_worker()
+        self.mqtt_service.disconnect()
+        self.db_manager.close_connections()
+    
+    def run(self):
+        """Run the complete monitoring system (main thread menjalankan web server)"""
         try:
-            # Start services
-            self.mqtt_service.connect()
-            self.telegram_service.start_worker()
-            self.start_background_tasks()
+            self.start_services()
             
-            # Start Flask app
             app = self.create_flask_app()
-            flask_thread = threading.Thread(
-                target=lambda: app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 8080))), 
-                daemon=True
-            )
-            flask_thread.start()
-            
-            # Start Telegram polling
-            self.telegram_service.start_polling()
+            app.run(host="0.0.0.0", port=int(os.environ.get("PORT", 8080)), threaded=True, use_reloader=False)
             
         except KeyboardInterrupt:
             logger.info("Shutting down...")
         finally:
-            self.stop_background_tasks()
-            self.telegram_service.stop_worker()
-            self.mqtt_service.disconnect()
\ No newline at end of file
+            self.stop_services()
@@ -1,3 +1,4 @@
-from .manager import DatabaseManager, User
+from .manager import DatabaseManager, User, iter_pivoted_rows
+from .pool import SQLiteConnectionPool
 
-__all__ = ['DatabaseManager', 'User']
+__all__ = ['DatabaseManager', 'User', 'SQLiteConnectionPool', 'iter_pivoted_rows']
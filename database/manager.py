@@ -1,10 +1,54 @@
 import sqlite3
 import logging
+import threading
+import time
+from functools import lru_cache, partial
+from pathlib import Path
+from argon2 import PasswordHasher
+from argon2.exceptions import VerificationError, InvalidHashError
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash
+from werkzeug.security import check_password_hash
+from .pool import SQLiteConnectionPool
 
 logger = logging.getLogger(__name__)
 
+password_hasher = PasswordHasher()
+
+def open_connection(db_path, read_only=False):
+    """Buka koneksi SQLite yang thread-safe dengan PRAGMA standar (read_only: dibuka dengan mode=ro)"""
+    if read_only:
+        uri = f"{Path(db_path).absolute().as_uri()}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, check_same_thread=False, timeout=30.0)
+    else:
+        conn = sqlite3.connect(db_path, check_same_thread=False, timeout=30.0)
+        conn.execute("PRAGMA journal_mode=WAL")
+        # WAL + synchronous=NORMAL: fsync hanya saat checkpoint, bukan setiap commit
+        conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA temp_store=MEMORY")
+    conn.execute("PRAGMA mmap_size=268435456")  # 256 MiB
+    conn.execute("PRAGMA cache_size=-16384")  # 16 MiB
+    conn.execute("PRAGMA busy_timeout=30000")
+    return conn
+
+def _fetch_pivoted_rows(conn, date_str, table_type, batch_size):
+    """Stream baris pivot satu tanggal per batch (fetchmany) dari koneksi yang diberikan.
+    Error SQLite tidak ditelan: pemanggil harus tahu jika data tidak terbaca lengkap"""
+    sql, _ = DatabaseManager._build_pivoted_query(table_type)
+    c = conn.cursor()
+    c.arraysize = batch_size
+    c.execute(sql, (f"{date_str} 00:00:00", f"{date_str} 23:59:59"))
+    while batch := c.fetchmany():
+        yield from batch
+
+def iter_pivoted_rows(db_path, date_str, table_type="dryer", batch_size=1000):
+    """Stream data pivot satu tanggal langsung dari file database dengan koneksi read-only sendiri.
+    Dipakai proses laporan terpisah yang tidak perlu DatabaseManager (DDL, pool, cache user)"""
+    conn = open_connection(db_path, read_only=True)
+    try:
+        yield from _fetch_pivoted_rows(conn, date_str, table_type, batch_size)
+    finally:
+        conn.close()
+
 class User(UserMixin):
     def __init__(self, id, username, password):
         self.id = id
@@ -14,8 +58,19 @@ class User(UserMixin):
 class DatabaseManager:
     """Class untuk mengelola operasi database untuk multi-system monitoring"""
     
-    def __init__(self, db_path):
+    def __init__(self, db_path, pool_size=4):
         self.db_path = db_path
+        # Satu koneksi writer (pool ukuran 1 sekaligus menserialisasi penulisan) dan
+        # beberapa koneksi read-only untuk request web/laporan yang tidak pernah mengambil write lock
+        self.pool = SQLiteConnectionPool(self.get_connection, size=1)
+        self.read_pool = SQLiteConnectionPool(partial(self.get_connection, read_only=True), size=pool_size)
+        
+        # Cache user untuk Flask-Login user_loader: user_id -> (expires_at, User)
+        self.user_cache_ttl = 60  # detik
+        self.user_cache_maxsize = 1024
+        self._user_cache = {}
+        self._user_cache_lock = threading.Lock()
+        
         self.initialize_database()
         
     def initialize_database(self):
@@ -53,6 +108,15 @@ class DatabaseManager:
                 )
             """)
             
+            # Covering index (waktu, device, suhu): range query per tanggal/jam dibaca langsung
+            # dari index tanpa lookup ke tabel. Index lama (waktu) saja menjadi redundant.
+            c.execute("CREATE INDEX IF NOT EXISTS idx_suhu_waktu_cover ON suhu(waktu, dryer_id, suhu)")
+            c.execute("CREATE INDEX IF NOT EXISTS idx_kedi_suhu_waktu_cover ON kedi_suhu(waktu, kedi_id, suhu)")
+            c.execute("CREATE INDEX IF NOT EXISTS idx_boiler_suhu_waktu_cover ON boiler_suhu(waktu, boiler_id, suhu)")
+            c.execute("DROP INDEX IF EXISTS idx_suhu_waktu")
+            c.execute("DROP INDEX IF EXISTS idx_kedi_suhu_waktu")
+            c.execute("DROP INDEX IF EXISTS idx_boiler_suhu_waktu")
+            
             # Tabel untuk Users (existing)
             c.execute("""
                 CREATE TABLE IF NOT EXISTS users (
@@ -64,18 +128,31 @@ class DatabaseManager:
             
         logger.info(f"Database multi-system initialized at: {self.db_path}")
     
-    def get_connection(self):
-        """Mendapatkan koneksi database yang thread-safe"""
-        conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30.0)
-        conn.execute("PRAGMA journal_mode=WAL")
-        return conn
+    def get_connection(self, read_only=False):
+        """Mendapatkan koneksi database yang thread-safe (read_only: dibuka dengan mode=ro)"""
+        return open_connection(self.db_path, read_only)
+    
+    def close_connections(self):
+        """Menutup semua koneksi di pool saat shutdown"""
+        self.pool.close_all()
+        self.read_pool.close_all()
+    
+    def run_maintenance(self):
+        """Lipat WAL ke database utama (TRUNCATE) dan jalankan PRAGMA optimize"""
+        try:
+            with self.pool.connection() as conn:
+                busy, wal_pages, checkpointed = conn.execute("PRAGMA wal_checkpoint(TRUNCATE)").fetchone()
+                conn.execute("PRAGMA optimize")
+            logger.info(f"Database maintenance selesai: {checkpointed}/{wal_pages} WAL pages checkpointed (busy={busy})")
+        except Exception as e:
+            logger.error(f"Error running database maintenance: {e}")
     
     # === User Management Methods (existing) ===
     def get_user_by_username(self, username):
         try:
-            with self.get_connection() as conn:
+            with self.read_pool.connection() as conn:
                 c = conn.cursor()
-                c.execute("SELECT * FROM users WHERE username = ?", (username,))
+                c.execute("SELECT id, username, password FROM users WHERE username = ?", (username,))
                 user_data = c.fetchone()
                 if user_data:
                     return User(id=user_data[0], username=user_data[1], password=user_data[2])
@@ -85,10 +162,32 @@ class DatabaseManager:
             return None
 
     def get_user_by_id(self, user_id):
+        """Mendapatkan user berdasarkan ID, dengan cache TTL di memori"""
+        key = str(user_id)
+        now = time.monotonic()
+        with self._user_cache_lock:
+            entry = self._user_cache.get(key)
+            if entry and entry[0] > now:
+                return entry[1]
+        
+        user = self._query_user_by_id(user_id)
+        if user is not None:
+            with self._user_cache_lock:
+                if len(self._user_cache) >= self.user_cache_maxsize:
+                    self._user_cache.clear()
+                self._user_cache[key] = (now + self.user_cache_ttl, user)
+        return user
+    
+    def invalidate_user_cache(self, user_id):
+        """Hapus user dari cache (mis. saat logout atau ganti password)"""
+        with self._user_cache_lock:
+            self._user_cache.pop(str(user_id), None)
+    
+    def _query_user_by_id(self, user_id):
         try:
-            with self.get_connection() as conn:
+            with self.read_pool.connection() as conn:
                 c = conn.cursor()
-                c.execute("SELECT * FROM users WHERE id = ?", (user_id,))
+                c.execute("SELECT id, username, password FROM users WHERE id = ?", (user_id,))
                 user_data = c.fetchone()
                 if user_data:
                     return User(id=user_data[0], username=user_data[1], password=user_data[2])
@@ -102,45 +201,75 @@ class DatabaseManager:
         if not self.get_user_by_username(username):
             logger.info(f"User '{username}' tidak ditemukan, mencoba membuat user baru...")
             try:
-                with self.get_connection() as conn:
+                with self.pool.connection() as conn:
                     c = conn.cursor()
-                    hashed_password = generate_password_hash(password, method='pbkdf2:sha256')
+                    hashed_password = password_hasher.hash(password)
                     c.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, hashed_password))
-                    conn.commit()
                     logger.info(f"User '{username}' berhasil dibuat dari environment secrets.")
             except Exception as e:
                 logger.error(f"Gagal membuat initial user: {e}")
     
-    # === Generic Temperature Methods ===
-    def insert_temperature(self, waktu, device_id, suhu, table_type="dryer"):
-        """Insert data suhu ke database dengan menyertakan ID device dan tipe tabel"""
-        table_map = {
-            "dryer": "suhu",
-            "kedi": "kedi_suhu", 
-            "boiler": "boiler_suhu"
-        }
-        
-        column_map = {
-            "dryer": "dryer_id",
-            "kedi": "kedi_id",
-            "boiler": "boiler_id"
-        }
+    def verify_user_password(self, user, password):
+        """Verifikasi password user. Hash pbkdf2 lama dimigrasi ke argon2 setelah login berhasil"""
+        if user.password.startswith('$argon2'):
+            try:
+                password_hasher.verify(user.password, password)
+            except (VerificationError, InvalidHashError):
+                return False
+            if password_hasher.check_needs_rehash(user.password):
+                self.update_user_password(user.id, password_hasher.hash(password))
+            return True
         
-        table_name = table_map.get(table_type, "suhu")
-        column_name = column_map.get(table_type, "dryer_id")
+        if not check_password_hash(user.password, password):
+            return False
+        self.update_user_password(user.id, password_hasher.hash(password))
+        logger.info(f"Password hash user '{user.username}' dimigrasi ke argon2")
+        return True
+    
+    def update_user_password(self, user_id, hashed_password):
+        self.invalidate_user_cache(user_id)
+        try:
+            with self.pool.connection() as conn:
+                conn.execute("UPDATE users SET password = ? WHERE id = ?", (hashed_password, user_id))
+            return True
+        except Exception as e:
+            logger.error(f"Error updating password for user ID {user_id}: {e}")
+            return False
+    
+    # === Generic Temperature Methods ===
+    # table_type -> (nama tabel, kolom id device)
+    TEMPERATURE_TABLES = {
+        "dryer": ("suhu", "dryer_id"),
+        "kedi": ("kedi_suhu", "kedi_id"),
+        "boiler": ("boiler_suhu", "boiler_id")
+    }
+    # SQL INSERT per tabel dibangun sekali; string yang sama selalu hit statement cache sqlite3
+    INSERT_SQL = {
+        table: f"INSERT INTO {table[0]} (waktu, {table[1]}, suhu) VALUES (?, ?, ?)"
+        for table in TEMPERATURE_TABLES.values()
+    }
+    
+    def insert_temperatures(self, records):
+        """Insert banyak data suhu dalam satu transaksi. records: iterable (waktu, device_id, suhu, table_type)"""
+        rows_by_table = {}
+        for waktu, device_id, suhu, table_type in records:
+            table = self.TEMPERATURE_TABLES.get(table_type, self.TEMPERATURE_TABLES["dryer"])
+            rows_by_table.setdefault(table, []).append((waktu, device_id, suhu))
         
         try:
-            with self.get_connection() as conn:
-                c = conn.cursor()
-                c.execute(f"INSERT INTO {table_name} (waktu, {column_name}, suhu) VALUES (?, ?, ?)", 
-                         (waktu, device_id, suhu))
+            with self.pool.connection() as conn:
+                for table, rows in rows_by_table.items():
+                    conn.executemany(self.INSERT_SQL[table], rows)
             return True
         except Exception as e:
-            logger.error(f"Error inserting temperature to {table_name}: {e}")
+            logger.error(f"Error inserting temperature batch: {e}")
             return False
     
-    def get_data_by_date_pivoted(self, date_str, latest_only=False, table_type="dryer"):
-        """Mendapatkan data untuk tanggal tertentu dengan pivot"""
+    @staticmethod
+    @lru_cache(maxsize=32)
+    def _build_pivoted_query(table_type, latest_only=False, time_format="%Y-%m-%d %H:%M:%S"):
+        """Bangun query pivot per device untuk satu tabel sistem. Return (sql, table_name)
+        Di-cache: string SQL yang sama dipakai ulang sehingga statement cache sqlite3 selalu hit"""
         table_map = {
             "dryer": ("suhu", "dryer_id", ["dryer1", "dryer2", "dryer3"]),
             "kedi": ("kedi_suhu", "kedi_id", ["kedi1", "kedi2"]),
@@ -149,73 +278,74 @@ class DatabaseManager:
         
         table_name, id_column, device_list = table_map.get(table_type, table_map["dryer"])
         
+        # Build CASE statements dynamically
+        case_statements = []
+        for device in device_list:
+            case_statements.append(f"MAX(CASE WHEN {id_column} = '{device}' THEN suhu END) as {device}_suhu")
+        
+        case_clause = ",\n                ".join(case_statements)
+        
+        # Grup selalu per detik (satu baris per sampel); time_format hanya menentukan kolom label,
+        # jadi label '%H:%M' tidak menggabungkan beberapa sampel dalam satu menit
+        sql = f"""
+        SELECT
+            strftime('{time_format}', waktu) as label,
+            {case_clause}
+        FROM {table_name}
+        WHERE waktu BETWEEN ? AND ?
+        GROUP BY strftime('%Y-%m-%d %H:%M:%S', waktu)
+        """
+        
+        if latest_only:
+            sql += " ORDER BY strftime('%Y-%m-%d %H:%M:%S', waktu) DESC LIMIT 1"
+        else:
+            sql += " ORDER BY strftime('%Y-%m-%d %H:%M:%S', waktu) ASC"
+        
+        return sql, table_name
+    
+    def get_data_by_date_pivoted(self, date_str, latest_only=False, table_type="dryer", time_format="%Y-%m-%d %H:%M:%S"):
+        """Mendapatkan data untuk tanggal tertentu dengan pivot (kolom waktu diformat dengan time_format)"""
+        sql, table_name = self._build_pivoted_query(table_type, latest_only, time_format)
+        
         try:
             start_time = f"{date_str} 00:00:00"
             end_time = f"{date_str} 23:59:59"
             
-            # Build CASE statements dynamically
-            case_statements = []
-            for device in device_list:
-                case_statements.append(f"MAX(CASE WHEN {id_column} = '{device}' THEN suhu END) as {device}_suhu")
-            
-            case_clause = ",\n                ".join(case_statements)
-            
-            sql = f"""
-            SELECT
-                strftime('%Y-%m-%d %H:%M:%S', waktu) as timestamp,
-                {case_clause}
-            FROM {table_name}
-            WHERE waktu BETWEEN ? AND ?
-            GROUP BY timestamp
-            """
-            
-            if latest_only:
-                sql += " ORDER BY timestamp DESC LIMIT 1"
-            else:
-                sql += " ORDER BY timestamp ASC"
-
-            with self.get_connection() as conn:
-                c = conn.cursor()
-                c.execute(sql, (start_time, end_time))
-                return c.fetchall()
+            with self.read_pool.connection() as conn:
+                return conn.execute(sql, (start_time, end_time)).fetchall()
         except Exception as e:
             logger.error(f"Error getting pivoted data for date {date_str} from {table_name}: {e}")
             return []
     
-    def get_data_since(self, since_time, table_type="dryer"):
-        """Mendapatkan data sejak waktu tertentu"""
-        table_map = {
-            "dryer": "suhu",
-            "kedi": "kedi_suhu",
-            "boiler": "boiler_suhu"
-        }
-        
-        table_name = table_map.get(table_type, "suhu")
+    def iter_data_by_date_pivoted(self, date_str, table_type="dryer", batch_size=1000):
+        """Versi generator get_data_by_date_pivoted: baris diambil per batch (fetchmany) tanpa fetchall.
+        Koneksi dipinjam dari read_pool selama generator berjalan; error SQLite diteruskan ke pemanggil"""
+        with self.read_pool.connection() as conn:
+            yield from _fetch_pivoted_rows(conn, date_str, table_type, batch_size)
+    
+    def get_temperature_stats_since(self, since_time, table_type="dryer"):
+        """Agregat (jumlah, min, max) suhu dibulatkan 2 desimal sejak waktu tertentu, dihitung di SQLite"""
+        table_name, _ = self.TEMPERATURE_TABLES.get(table_type, self.TEMPERATURE_TABLES["dryer"])
         
         try:
-            with self.get_connection() as conn:
-                c = conn.cursor()
-                c.execute(f"SELECT * FROM {table_name} WHERE datetime(waktu) >= datetime(?) ORDER BY waktu", (since_time,))
-                return c.fetchall()
+            with self.read_pool.connection() as conn:
+                return conn.execute(
+                    f"SELECT COUNT(suhu), MIN(ROUND(suhu, 2)), MAX(ROUND(suhu, 2)) FROM {table_name} WHERE waktu >= ?",
+                    (since_time,)
+                ).fetchone()
         except Exception as e:
-            logger.error(f"Error getting data since {since_time} from {table_name}: {e}")
-            return []
+            logger.error(f"Error getting temperature stats since {since_time} from {table_name}: {e}")
+            return (0, None, None)
     
     def get_recent_data(self, limit=5, table_type="dryer"):
-        """Mendapatkan data terbaru"""
-        table_map = {
-            "dryer": ("suhu", "dryer_id"),
-            "kedi": ("kedi_suhu", "kedi_id"),
-            "boiler": ("boiler_suhu", "boiler_id")
-        }
-        
-        table_name, id_column = table_map.get(table_type, table_map["dryer"])
+        """Mendapatkan data terbaru (scan mundur primary key, berhenti setelah `limit` baris)"""
+        table_name, id_column = self.TEMPERATURE_TABLES.get(table_type, self.TEMPERATURE_TABLES["dryer"])
         
         try:
-            with self.get_connection() as conn:
-                c = conn.cursor()
-                c.execute(f"SELECT waktu, {id_column}, suhu FROM {table_name} ORDER BY id DESC LIMIT ?", (limit,))
-                return c.fetchall()
+            with self.read_pool.connection() as conn:
+                return conn.execute(
+                    f"SELECT waktu, {id_column}, suhu FROM {table_name} ORDER BY id DESC LIMIT ?", (limit,)
+                ).fetchall()
         except Exception as e:
             logger.error(f"Error getting recent data from {table_name}: {e}")
             return []
\ No newline at end of file
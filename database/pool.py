@@ -0,0 +1,60 @@
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+from queue import Queue, Empty
+
+logger = logging.getLogger(__name__)
+
+class SQLiteConnectionPool:
+    """Pool koneksi SQLite yang sudah diinisialisasi (PRAGMA diterapkan sekali per koneksi)"""
+    
+    def __init__(self, connect, size=4):
+        self._connect = connect
+        self.size = size
+        self._pool = Queue(maxsize=size)
+        self._created = 0
+        self._created_lock = threading.Lock()
+        
+    @contextmanager
+    def connection(self):
+        """Pinjam satu koneksi sebagai transaksi (`with conn:`) lalu kembalikan ke pool"""
+        conn = self._acquire()
+        try:
+            with conn:
+                yield conn
+        finally:
+            self._pool.put(conn)
+    
+    def _acquire(self):
+        try:
+            return self._pool.get_nowait()
+        except Empty:
+            pass
+        # Koneksi dibuat lazily sampai batas ukuran pool, setelah itu tunggu yang dikembalikan
+        with self._created_lock:
+            can_create = self._created < self.size
+            if can_create:
+                self._created += 1
+        if can_create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._created_lock:
+                    self._created -= 1
+                raise
+        return self._pool.get()
+    
+    def close_all(self):
+        """Tutup semua koneksi yang sedang berada di pool (dipanggil saat shutdown)"""
+        while True:
+            try:
+                conn = self._pool.get_nowait()
+            except Empty:
+                break
+            try:
+                conn.close()
+            except sqlite3.Error as e:
+                logger.error(f"Error closing database connection: {e}")
+            with self._created_lock:
+                self._created -= 1
@@ -0,0 +1,44 @@
+# Konfigurasi gunicorn untuk Temperature Monitor
+# Satu worker saja: proses ini juga memegang koneksi MQTT, Telegram polling,
+# dan background tasks, sehingga worker kedua akan menduplikasi semuanya.
+# Koneksi SSE (/stream-data, /stream-notifications) dilayani oleh thread pool.
+# Setiap koneksi SSE memegang satu thread selama tab dashboard terbuka (satu tab
+# bisa membuka sampai 3 stream). Jika thread habis, /login, /data dan /keepalive
+# ikut mengantre, jadi pool diukur dari jumlah tab yang diharapkan.
+import os
+import signal
+
+# Jumlah tab dashboard terbuka bersamaan yang harus bisa dilayani
+MAX_DASHBOARD_TABS = int(os.environ.get("MAX_DASHBOARD_TABS", 50))
+# Stream SSE maksimum per tab (index.js: data + notifikasi, halaman mesin: data)
+SSE_STREAMS_PER_TAB = 3
+# Thread cadangan untuk request biasa di luar SSE
+REQUEST_THREADS = 16
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8080)}"
+workers = 1
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", MAX_DASHBOARD_TABS * SSE_STREAMS_PER_TAB + REQUEST_THREADS))
+timeout = 60
+# Harus di atas total waktu stop_services: stop polling Telegram (10s) + shutdown bot (5s)
+# + join worker Telegram (5s) + join background tasks (paralel, 5s) + consumer MQTT (5s)
+graceful_timeout = 45
+accesslog = "-"
+
+
+def post_worker_init(worker):
+    """SIGTERM: tutup stream SSE lebih dulu, baru gunicorn menunggu request yang tersisa selesai"""
+    from wsgi import monitor
+    handle_exit = signal.getsignal(signal.SIGTERM)
+
+    def handle_term(sig, frame):
+        monitor.begin_shutdown()
+        handle_exit(sig, frame)
+
+    signal.signal(signal.SIGTERM, handle_term)
+
+
+def worker_exit(server, worker):
+    """Hentikan MQTT, Telegram dan background tasks setelah worker selesai melayani request"""
+    from wsgi import monitor
+    monitor.stop_services()
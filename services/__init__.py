@@ -1,4 +1,5 @@
+from .excel_service import build_excel_report
 from .mqtt_service import MQTTService
 from .telegram_service import TelegramService
 
-__all__ = ['MQTTService', 'TelegramService']
\ No newline at end of file
+__all__ = ['build_excel_report', 'MQTTService', 'TelegramService']
\ No newline at end of file
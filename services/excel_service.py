@@ -0,0 +1,101 @@
+import datetime
+import logging
+from functools import partial
+from zipfile import ZipFile, ZIP_DEFLATED
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Font
+from openpyxl.utils import get_column_letter
+from openpyxl.writer.excel import ExcelWriter
+from database.manager import iter_pivoted_rows
+
+logger = logging.getLogger(__name__)
+
+# Header kolom laporan per sistem (dibangun sekali saat import)
+REPORT_HEADERS = {
+    "dryer": ("Waktu (WIB)", "Dryer 1 (°C)", "Dryer 2 (°C)", "Dryer 3 (°C)"),
+    "kedi": ("Waktu (WIB)", "Kedi 1 (°C)", "Kedi 2 (°C)"),
+    "boiler": ("Waktu (WIB)", "Boiler 1 (°C)", "Boiler 2 (°C)"),
+}
+REPORT_SYSTEMS = tuple(REPORT_HEADERS)
+WAKTU_COLUMN_WIDTH = 22  # 'YYYY-MM-DD HH:MM:SS'
+SUHU_COLUMN_WIDTH = 14
+
+# Batas baris data per sheet (Excel maksimal 1.048.576 baris termasuk header) dan panjang nama sheet
+MAX_ROWS_PER_SHEET = 1_000_000
+MAX_SHEET_TITLE = 31
+
+# Style header dibuat sekali dan dipakai bersama oleh semua sheet
+HEADER_FONT = Font(bold=True)
+HEADER_ALIGNMENT = Alignment(horizontal='center')
+
+# DEFLATE level 1: jauh lebih cepat dari default (6) dengan selisih ukuran kecil untuk tabel angka
+ZIP_COMPRESS_LEVEL = 1
+
+def save_workbook(wb, target):
+    """Simpan workbook ke path/file object dengan kompresi zip ringan (pengganti wb.save).
+    Mengikuti openpyxl.writer.excel.save_workbook milik openpyxl==3.1.5 (versi di requirements.txt);
+    periksa ulang fungsi ini saat menaikkan versi openpyxl"""
+    if wb.read_only:
+        raise TypeError("Workbook is read-only")
+    if wb.write_only and not wb.worksheets:
+        wb.create_sheet()
+    archive = ZipFile(target, 'w', ZIP_DEFLATED, allowZip64=True, compresslevel=ZIP_COMPRESS_LEVEL)
+    # Sama seperti wb.save: timestamp "modified" di metadata file = waktu penyimpanan (UTC)
+    wb.properties.modified = datetime.datetime.now(tz=datetime.timezone.utc).replace(tzinfo=None)
+    ExcelWriter(wb, archive).save()
+
+def create_report_sheet(wb, system, title=None):
+    """Buat sheet di write-only workbook dengan lebar kolom tetap dan header sistem"""
+    ws = wb.create_sheet(title=title)
+    
+    # Lebar kolom tetap dari skema (write-only tidak punya ws.columns untuk auto-width)
+    ws.column_dimensions['A'].width = WAKTU_COLUMN_WIDTH
+    headers = REPORT_HEADERS.get(system)
+    if headers:
+        for col_idx in range(2, len(headers) + 1):
+            ws.column_dimensions[get_column_letter(col_idx)].width = SUHU_COLUMN_WIDTH
+        ws.append([_header_cell(ws, header) for header in headers])
+    return ws
+
+def _header_cell(ws, value):
+    cell = WriteOnlyCell(ws, value=value)
+    cell.font = HEADER_FONT
+    cell.alignment = HEADER_ALIGNMENT
+    return cell
+
+def write_report_rows(wb, system, rows, title=None):
+    """Stream baris ke sheet laporan; pindah ke sheet lanjutan setiap MAX_ROWS_PER_SHEET baris.
+    Return jumlah baris data"""
+    ws = create_report_sheet(wb, system, title)
+    
+    row_count = 0
+    for row in rows:
+        if row_count and row_count % MAX_ROWS_PER_SHEET == 0:
+            part = row_count // MAX_ROWS_PER_SHEET + 1
+            ws = create_report_sheet(wb, system, f"{title[:MAX_SHEET_TITLE - 5]} ({part})" if title else None)
+        ws.append(row)
+        row_count += 1
+    return row_count
+
+def build_excel_report(db_manager, date_str, filename, save_empty=False):
+    """Bangun laporan Excel semua sistem (satu sheet per sistem) untuk satu tanggal.
+    Return jumlah baris per sistem; file tidak disimpan jika kosong kecuali save_empty=True"""
+    return _build_report(db_manager.iter_data_by_date_pivoted, date_str, filename, save_empty)
+
+def _build_report(iter_rows, date_str, filename, save_empty):
+    """Isi build_excel_report; iter_rows(date_str, table_type=...) menghasilkan baris pivot per sistem"""
+    # Write-only workbook: baris di-stream tanpa cell object
+    wb = Workbook(write_only=True)
+    row_counts = {
+        system: write_report_rows(wb, system, iter_rows(date_str, table_type=system), f"Data {system.title()} {date_str}")
+        for system in REPORT_SYSTEMS
+    }
+    
+    if save_empty or any(row_counts.values()):
+        save_workbook(wb, filename)
+    return row_counts
+
+def build_excel_report_from_path(db_path, date_str, filename, save_empty=False):
+    """Versi build_excel_report untuk proses terpisah: baca langsung dari db_path dengan koneksi read-only"""
+    return _build_report(partial(iter_pivoted_rows, db_path), date_str, filename, save_empty)
@@ -1,22 +1,28 @@
 import paho.mqtt.client as mqtt
 import logging
-import time
+import random
 import threading
+from queue import SimpleQueue
 
 logger = logging.getLogger(__name__)
 
 class MQTTService:
-    """Class untuk mengelola koneksi dan komunikasi MQTT dengan auto-reconnection"""
+    """Class untuk mengelola koneksi dan komunikasi MQTT dengan auto-reconnection dari paho"""
     
     def __init__(self, config, data_callback):
         self.config = config
         self.data_callback = data_callback
-        self.client = mqtt.Client()
+        self.client = mqtt.Client(client_id=config.MQTT_CLIENT_ID, clean_session=False)
         self.is_connected = False
-        self.should_reconnect = True
-        self.reconnect_thread = None
-        self.reconnect_delay = 5  # seconds
+        # Reconnect ditangani network loop paho (loop_start); waktu tunggu tiap percobaan diacak
+        # ulang (jitter) di _apply_reconnect_jitter agar beberapa klien tidak reconnect serentak
+        self.min_reconnect_delay = 5  # seconds, cap awal backoff
         self.max_reconnect_delay = 300  # 5 minutes
+        self._reconnect_attempts = 0
+        self._apply_reconnect_jitter()
+        # Network thread paho hanya meneruskan payload mentah; parsing & callback di consumer thread
+        self.message_queue = SimpleQueue()
+        self.consumer_thread = None
         self.setup_callbacks()
         
     def setup_callbacks(self):
@@ -24,96 +30,90 @@ class MQTTService:
         self.client.on_connect = self._on_connect
         self.client.on_message = self._on_message
         self.client.on_disconnect = self._on_disconnect
+        self.client.on_connect_fail = self._on_connect_fail
+    
+    def _apply_reconnect_jitter(self):
+        """Jitter: tunggu acak min_reconnect_delay/2..cap sebelum percobaan berikutnya, cap berlipat dua sampai
+        max_reconnect_delay. Batas bawah non-nol agar broker yang terus menolak tidak dihajar reconnect beruntun.
+        paho memakai min_delay sebagai waktu tunggu berikutnya karena reconnect_delay_set mereset backoff-nya"""
+        cap = min(self.max_reconnect_delay, self.min_reconnect_delay * 2 ** min(self._reconnect_attempts, 16))
+        self._reconnect_attempts += 1
+        delay = random.uniform(self.min_reconnect_delay / 2, cap)
+        self.client.reconnect_delay_set(min_delay=delay, max_delay=self.max_reconnect_delay)
+        return delay
     
     def _on_connect(self, client, userdata, flags, rc):
         """Callback ketika terhubung ke MQTT broker"""
         if rc == 0:
             self.is_connected = True
-            self.reconnect_delay = 5  # Reset delay on successful connection
+            self._reconnect_attempts = 0
             logger.info(f"MQTT Connected successfully at {self.config.format_indonesia_time()}")
             
             # Subscribe to all topics
             for topic_name, topic in self.config.MQTT_TOPICS.items():
                 if topic: 
-                    self.client.subscribe(topic)
+                    self.client.subscribe(topic, qos=self.config.MQTT_QOS)
                     logger.info(f"Subscribed to {topic_name}: {topic}")
         else:
             logger.error(f"MQTT Connection failed with code {rc}")
             self.is_connected = False
     
     def _on_message(self, client, userdata, msg):
-        """Callback ketika menerima message MQTT"""
-        try:
-            raw_suhu = float(msg.payload.decode())
-            if self.data_callback:
-                self.data_callback(raw_suhu, msg.topic)
-        except Exception as e:
-            logger.error(f"Error parsing MQTT data: {e}")
+        """Callback ketika menerima message MQTT: hanya antrekan payload mentah"""
+        self.message_queue.put((msg.topic, msg.payload))
+    
+    def _consume_messages(self):
+        """Consumer thread: parse payload dan teruskan ke data_callback"""
+        while True:
+            item = self.message_queue.get()
+            if item is None:
+                break
+            topic, payload = item
+            try:
+                # float() menerima bytes langsung; tidak perlu decode ke str
+                raw_suhu = float(payload)
+                if self.data_callback:
+                    self.data_callback(raw_suhu, topic)
+            except Exception as e:
+                logger.error(f"Error parsing MQTT data: {e}")
+    
+    def _start_consumer(self):
+        if self.consumer_thread is None or not self.consumer_thread.is_alive():
+            self.consumer_thread = threading.Thread(target=self._consume_messages, daemon=True, name="MQTTConsumer")
+            self.consumer_thread.start()
     
     def _on_disconnect(self, client, userdata, rc):
-        """Callback ketika terputus dari MQTT broker"""
+        """Callback ketika terputus dari MQTT broker; reconnect otomatis oleh network loop paho"""
         self.is_connected = False
-        logger.warning(f"MQTT Disconnected with code {rc} at {self.config.format_indonesia_time()}")
-        
-        # Start reconnection process if needed
-        if self.should_reconnect and rc != 0:  # rc != 0 means unexpected disconnect
-            self._start_reconnection()
-    
-    def _start_reconnection(self):
-        """Start the reconnection process in a separate thread"""
-        if self.reconnect_thread is None or not self.reconnect_thread.is_alive():
-            self.reconnect_thread = threading.Thread(target=self._reconnect_loop, daemon=True)
-            self.reconnect_thread.start()
+        if rc == 0:
+            # Disconnect yang kita minta sendiri (disconnect() saat shutdown): tidak ada reconnect
+            logger.info(f"MQTT Disconnected at {self.config.format_indonesia_time()}")
+            return
+        delay = self._apply_reconnect_jitter()
+        logger.warning(f"MQTT Disconnected with code {rc} at {self.config.format_indonesia_time()}, reconnect dalam {delay:.1f} detik")
     
-    def _reconnect_loop(self):
-        """Reconnection loop that runs in a separate thread"""
-        while self.should_reconnect and not self.is_connected:
-            try:
-                logger.info(f"Attempting to reconnect to MQTT broker in {self.reconnect_delay} seconds...")
-                time.sleep(self.reconnect_delay)
-                
-                if not self.should_reconnect:
-                    break
-                    
-                logger.info("Reconnecting to MQTT broker...")
-                self.client.connect(self.config.MQTT_BROKER, self.config.MQTT_PORT, 60)
-                
-                # If connection is successful, the on_connect callback will handle the rest
-                # Wait a bit to see if connection was successful
-                time.sleep(2)
-                
-                if not self.is_connected:
-                    # Exponential backoff with max limit
-                    self.reconnect_delay = min(self.reconnect_delay * 2, self.max_reconnect_delay)
-                    
-            except Exception as e:
-                logger.error(f"MQTT Reconnection failed: {e}")
-                # Exponential backoff with max limit
-                self.reconnect_delay = min(self.reconnect_delay * 2, self.max_reconnect_delay)
+    def _on_connect_fail(self, client, userdata):
+        """Callback ketika percobaan koneksi gagal (broker tidak terjangkau, DNS, dsb.)"""
+        delay = self._apply_reconnect_jitter()
+        logger.warning(f"MQTT connection to {self.config.MQTT_BROKER}:{self.config.MQTT_PORT} failed, mencoba lagi dalam {delay:.1f} detik")
     
     def connect(self):
-        """Connect ke MQTT broker"""
-        try:
-            self.should_reconnect = True
-            self.client.connect(self.config.MQTT_BROKER, self.config.MQTT_PORT, 60)
-            self.client.loop_start()
-            logger.info("MQTT Client started")
-            return True
-        except Exception as e:
-            logger.error(f"MQTT Connection failed: {e}")
-            # Start reconnection process
-            self._start_reconnection()
-            return False
+        """Connect ke MQTT broker. Koneksi awal dan reconnect dilakukan di network thread paho"""
+        self._start_consumer()
+        self.client.connect_async(self.config.MQTT_BROKER, self.config.MQTT_PORT, keepalive=60)
+        self.client.loop_start()
+        logger.info("MQTT Client started")
+        return True
     
     def disconnect(self):
         """Disconnect dari MQTT broker"""
-        self.should_reconnect = False
-        self.client.loop_stop()
         self.client.disconnect()
+        self.client.loop_stop()
         
-        # Wait for reconnect thread to finish
-        if self.reconnect_thread and self.reconnect_thread.is_alive():
-            self.reconnect_thread.join(timeout=5)
+        # Hentikan consumer thread setelah pesan yang tersisa diproses
+        if self.consumer_thread and self.consumer_thread.is_alive():
+            self.message_queue.put(None)
+            self.consumer_thread.join(timeout=5)
     
     def is_broker_connected(self):
         """Check if connected to MQTT broker"""
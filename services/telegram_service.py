@@ -1,33 +1,63 @@
-from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update, Bot
+from telegram import InlineKeyboardButton, InlineKeyboardMarkup, Update
 from telegram.ext import ContextTypes, ApplicationBuilder, CallbackQueryHandler, MessageHandler, filters
 import asyncio
 import threading
 import logging
-from queue import Queue, Empty
-from openpyxl import Workbook
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from .excel_service import build_excel_report_from_path
 import os
 
 logger = logging.getLogger(__name__)
 
 class TelegramService:
-    """Class untuk mengelola komunikasi Telegram dengan antrean dan worker."""
+    """Class untuk mengelola komunikasi Telegram (pengiriman dan polling) lewat satu event loop worker yang persisten."""
     
     def __init__(self, config, db_manager):
         self.config = config
         self.db_manager = db_manager
-        self.bot = Bot(token=config.TELEGRAM_TOKEN)
         self.application = ApplicationBuilder().token(self.config.TELEGRAM_TOKEN).build()
+        # Bot milik Application dipakai juga untuk pengiriman; polling dan pengiriman berjalan di
+        # satu event loop yang sama sehingga koneksi HTTP (httpx) dipakai bersama dengan aman
+        self.bot = self.application.bot
         self._setup_handlers()
-        self.message_queue = Queue()
+        self.loop = asyncio.new_event_loop()
+        # Pengiriman diberi jarak minimum agar burst alert tidak melewati batas 30 pesan/detik Telegram
+        self.min_send_interval = 1 / 30
+        self._send_lock = asyncio.Lock()
+        self._last_send = 0.0
+        # Backoff percobaan ulang initialize/start polling saat Telegram belum bisa dijangkau
+        self.polling_retry_initial_delay = 1  # detik
+        self.polling_retry_max_delay = 300  # detik
+        self._polling_future = None
         self.worker_thread = None
         self.is_worker_running = False
 
     def _setup_handlers(self):
+        # callback_data tombol inline -> handler
+        self._button_handlers = {
+            "test": self._handle_test,
+            "data_dryer": partial(self._handle_data, system_type="dryer"),
+            "data_kedi": partial(self._handle_data, system_type="kedi"),
+            "data_boiler": partial(self._handle_data, system_type="boiler"),
+            "force_excel": self._handle_force_excel,
+        }
         self.application.add_handler(MessageHandler(filters.Regex('^Mulai$'), self.start))
         self.application.add_handler(CallbackQueryHandler(self.button))
 
+    async def _throttle(self):
+        """Tunggu sampai jarak minimum sejak pengiriman terakhir terpenuhi"""
+        async with self._send_lock:
+            delay = self._last_send + self.min_send_interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            self._last_send = time.monotonic()
+
     async def _send_message_async(self, message):
         try:
+            await self._throttle()
             await self.bot.send_message(chat_id=self.config.CHAT_ID, text=message, parse_mode="Markdown")
             logger.info("Pesan Telegram berhasil dikirim dari worker.")
         except Exception as e:
@@ -35,46 +65,46 @@ class TelegramService:
 
     async def _send_document_async(self, file_path, caption):
         try:
+            await self._throttle()
             with open(file_path, "rb") as file:
                 await self.bot.send_document(chat_id=self.config.CHAT_ID, document=file, caption=caption, parse_mode="Markdown")
             logger.info(f"Dokumen {file_path} berhasil dikirim dari worker.")
         except Exception as e:
             logger.error(f"Gagal mengirim dokumen dari worker: {e}")
 
-    def _process_queue(self):
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        while self.is_worker_running:
-            try:
-                task_type, *args = self.message_queue.get(timeout=1) 
-                if task_type == 'message':
-                    loop.run_until_complete(self._send_message_async(args[0]))
-                elif task_type == 'document':
-                    loop.run_until_complete(self._send_document_async(args[0], args[1]))
-                self.message_queue.task_done()
-            except Empty:
-                continue
-            except Exception as e:
-                logger.error(f"Error di dalam Telegram worker thread: {e}")
+    def _run_loop(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def _submit(self, coro):
+        """Jadwalkan coroutine di event loop worker dari thread mana pun"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
 
     def start_worker(self):
         if not self.is_worker_running:
             self.is_worker_running = True
-            self.worker_thread = threading.Thread(target=self._process_queue, daemon=True, name="TelegramWorker")
+            self.worker_thread = threading.Thread(target=self._run_loop, daemon=True, name="TelegramWorker")
             self.worker_thread.start()
             logger.info("Telegram worker thread dimulai.")
 
     def stop_worker(self):
+        if not self.is_worker_running:
+            return
         self.is_worker_running = False
+        try:
+            self._submit(self.application.shutdown()).result(timeout=5)
+        except Exception as e:
+            logger.error(f"Gagal menutup koneksi Bot Telegram: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
         if self.worker_thread:
             self.worker_thread.join(timeout=5)
             logger.info("Telegram worker thread dihentikan.")
 
     def send_message(self, message):
-        self.message_queue.put(('message', message))
+        self._submit(self._send_message_async(message))
 
     def send_document(self, file_path, caption):
-        self.message_queue.put(('document', file_path, caption))
+        self._submit(self._send_document_async(file_path, caption))
     
     async def start(self, update, context):
         keyboard = [
@@ -87,20 +117,13 @@ class TelegramService:
         reply_markup = InlineKeyboardMarkup(keyboard)
         await update.message.reply_text("Pilih opsi:", reply_markup=reply_markup)
     
-    async def button(self, query, context):
+    async def button(self, update, context):
         query = update.callback_query
         await query.answer()
         
-        if query.data == "test":
-            await self._handle_test(query)
-        elif query.data == "data_dryer":
-            await self._handle_data(query, "dryer")
-        elif query.data == "data_kedi":
-            await self._handle_data(query, "kedi")
-        elif query.data == "data_boiler":
-            await self._handle_data(query, "boiler")
-        elif query.data == "force_excel":
-            await self._handle_force_excel(query)
+        handler = self._button_handlers.get(query.data)
+        if handler:
+            await handler(query)
     
     async def _handle_test(self, query):
         current_time = self.config.format_indonesia_time()
@@ -119,35 +142,21 @@ class TelegramService:
     
     async def _handle_force_excel(self, query):
         await query.edit_message_text("📊 Generating Excel... Please wait...")
-        today_str = self.config.get_indonesia_time().strftime('%Y-%m-%d')
+        today_str = self.config.format_indonesia_date()
         
         # Generate Excel untuk semua sistem
-        systems = ["dryer", "kedi", "boiler"]
         temp_dir = "/tmp" if os.path.exists("/tmp") else "."
         filename = os.path.join(temp_dir, f"manual_report_all_systems_{today_str}.xlsx")
-        
-        wb = Workbook()
-        
-        for i, system in enumerate(systems):
-            if i == 0:
-                ws = wb.active
-                ws.title = f"Data {system.title()} {today_str}"
-            else:
-                ws = wb.create_sheet(title=f"Data {system.title()} {today_str}")
-            
-            rows = self.db_manager.get_data_by_date_pivoted(today_str, table_type=system)
-            
-            if system == "dryer":
-                ws.append(["Waktu (WIB)", "Dryer 1 (°C)", "Dryer 2 (°C)", "Dryer 3 (°C)"])
-            elif system == "kedi":
-                ws.append(["Waktu (WIB)", "Kedi 1 (°C)", "Kedi 2 (°C)"])
-            elif system == "boiler":
-                ws.append(["Waktu (WIB)", "Boiler 1 (°C)", "Boiler 2 (°C)"])
-            
-            for row in rows: 
-                ws.append(list(row))
-        
-        wb.save(filename)
+        # Dibangun di proses terpisah agar event loop polling tidak terblokir selama pembuatan Excel
+        try:
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                await asyncio.get_running_loop().run_in_executor(
+                    executor, build_excel_report_from_path, self.db_manager.db_path, today_str, filename, True
+                )
+        except Exception as e:
+            logger.error(f"Gagal membuat laporan Excel manual untuk tanggal {today_str}: {e}")
+            await query.edit_message_text("❌ Gagal membuat Excel, lihat log server.")
+            return
         caption = f"📊 Laporan Manual Semua Sistem - {today_str}"
         
         with open(filename, "rb") as file:
@@ -160,6 +169,49 @@ class TelegramService:
             
         await query.edit_message_text(f"✅ Excel sent! All systems data")
     
+    async def _start_polling_async(self):
+        """Initialize bot lalu mulai polling; gagal (mis. jaringan) dicoba ulang dengan exponential backoff"""
+        delay = self.polling_retry_initial_delay
+        while True:
+            try:
+                # initialize() tidak melakukan apa-apa jika sudah pernah berhasil
+                await self.application.initialize()
+                if not self.application.updater.running:
+                    await self.application.updater.start_polling()
+                await self.application.start()
+                logger.info("Telegram polling dimulai.")
+                return
+            except Exception as e:
+                logger.warning(f"Gagal memulai Telegram polling: {e}. Mencoba lagi dalam {delay} detik")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, self.polling_retry_max_delay)
+
+    def _on_polling_done(self, future):
+        """Done-callback future start polling: pastikan error tidak hilang tanpa log"""
+        if not future.cancelled() and future.exception() is not None:
+            logger.error(f"Telegram polling gagal dimulai: {future.exception()}")
+
+    async def _stop_polling_async(self):
+        if self.application.updater.running:
+            await self.application.updater.stop()
+        if self.application.running:
+            await self.application.stop()
+
     def start_polling(self):
-        if self.application:
-            self.application.run_polling()
\ No newline at end of file
+        """Mulai polling update Telegram di event loop worker (start_worker harus dipanggil lebih dulu)"""
+        if self.is_worker_running and self._polling_future is None:
+            self._polling_future = self._submit(self._start_polling_async())
+            self._polling_future.add_done_callback(self._on_polling_done)
+    
+    def stop_polling(self):
+        if not self.is_worker_running:
+            return
+        if self._polling_future is not None:
+            # Hentikan percobaan ulang yang mungkin masih menunggu backoff
+            self._polling_future.cancel()
+            self._polling_future = None
+        try:
+            self._submit(self._stop_polling_async()).result(timeout=10)
+            logger.info("Telegram polling dihentikan.")
+        except Exception as e:
+            logger.error(f"Gagal menghentikan Telegram polling: {e}")
@@ -1,5 +1,6 @@
 from .base_task import BackgroundTask
 from .data_save_task import DataSaveTask
+from .db_maintenance_task import DatabaseMaintenanceTask
 from .excel_report_task import DailyExcelReportTask
 from .keepalive_task import KeepaliveTask
 from .monitor_data_task import MonitorDataTask
@@ -7,6 +8,7 @@ from .monitor_data_task import MonitorDataTask
 __all__ = [
     'BackgroundTask',
     'DataSaveTask', 
+    'DatabaseMaintenanceTask',
     'DailyExcelReportTask',
     'KeepaliveTask',
     'MonitorDataTask'
@@ -12,6 +12,12 @@ class BackgroundTask:
         self.name = name
         self.thread = None
         self.is_running = False
+        # Di-set oleh stop() untuk membangunkan thread yang sedang menunggu interval
+        self._stop_event = threading.Event()
+        
+    def wait(self, timeout):
+        """Tunggu hingga timeout detik; return True jika task dihentikan selama menunggu"""
+        return self._stop_event.wait(timeout)
         
     def task(self):
         """Method yang harus di-override oleh subclass"""
@@ -20,22 +26,37 @@ class BackgroundTask:
     def run(self):
         """Main run loop for the background task"""
         self.is_running = True
+        # Deadline monotonic: durasi task() tidak menggeser jadwal interval berikutnya
+        deadline = time.monotonic()
         while self.is_running:
+            deadline += self.interval
             try:
                 if self.is_running: 
                     self.task()
             except Exception as e:
                 logger.error(f"Error in {self.name}: {e}")
             if self.interval > 0:
-                time.sleep(self.interval)
+                delay = deadline - time.monotonic()
+                if delay > 0:
+                    if self.wait(delay):
+                        break
+                else:
+                    # Task melewati interval: mulai jadwal baru, jangan kejar siklus yang terlewat
+                    deadline = time.monotonic()
                 
     def start(self):
         """Start the background task in a separate thread"""
+        self._stop_event.clear()
         self.thread = threading.Thread(target=self.run, daemon=True, name=self.name)
         self.thread.start()
         
+    def request_stop(self):
+        """Minta task berhenti tanpa menunggu thread selesai"""
+        self.is_running = False
+        self._stop_event.set()
+        
     def stop(self):
         """Stop the background task"""
-        self.is_running = False
+        self.request_stop()
         if self.thread: 
             self.thread.join(timeout=5)
\ No newline at end of file
@@ -13,38 +13,25 @@ class DataSaveTask(BackgroundTask):
         self.db_manager = db_manager
     
     def task(self):
-        """Menyimpan data suhu terakhir dari memori ke database."""
+        """Menyimpan data suhu terakhir dari memori ke database dalam satu transaksi."""
         latest_temps = self.data_provider.get_latest_temperatures()
         waktu = self.config.format_indonesia_time_simple()
         
-        logger.info(f"Menjalankan DataSaveTask pada {waktu}. Menyimpan data terakhir...")
+        # Kumpulkan data dryer, kedi dan boiler lalu simpan sekaligus
+        records = [
+            (waktu, device_id, temp, system_type)
+            for system_type, devices in latest_temps.items()
+            for device_id, temp in devices.items()
+            if temp is not None
+        ]
+        if not records:
+            return
         
-        # Save dryer data
-        dryer_data = latest_temps.get('dryer', {})
-        for dryer_id, temp in dryer_data.items():
-            if temp is not None:
-                success = self.db_manager.insert_temperature(waktu, dryer_id, temp, "dryer")
-                if success:
-                    logger.info(f"Data tersimpan untuk {dryer_id}: {waktu} | {temp:.2f}°C")
-                else:
-                    logger.error(f"Gagal menyimpan data untuk {dryer_id}")
-        
-        # Save kedi data
-        kedi_data = latest_temps.get('kedi', {})
-        for kedi_id, temp in kedi_data.items():
-            if temp is not None:
-                success = self.db_manager.insert_temperature(waktu, kedi_id, temp, "kedi")
-                if success:
-                    logger.info(f"Data tersimpan untuk {kedi_id}: {waktu} | {temp:.2f}°C")
-                else:
-                    logger.error(f"Gagal menyimpan data untuk {kedi_id}")
-        
-        # Save boiler data
-        boiler_data = latest_temps.get('boiler', {})
-        for boiler_id, temp in boiler_data.items():
-            if temp is not None:
-                success = self.db_manager.insert_temperature(waktu, boiler_id, temp, "boiler")
-                if success:
-                    logger.info(f"Data tersimpan untuk {boiler_id}: {waktu} | {temp:.2f}°C")
-                else:
-                    logger.error(f"Gagal menyimpan data untuk {boiler_id}")
\ No newline at end of file
+        if self.db_manager.insert_temperatures(records):
+            # Satu baris INFO per batch; detail per device hanya jika DEBUG aktif
+            logger.info("DataSaveTask menyimpan %d data pada %s", len(records), waktu)
+            if logger.isEnabledFor(logging.DEBUG):
+                for _, device_id, temp, _ in records:
+                    logger.debug(f"Data tersimpan untuk {device_id}: {waktu} | {temp:.2f}°C")
+        else:
+            logger.error(f"Gagal menyimpan {len(records)} data pada {waktu}")
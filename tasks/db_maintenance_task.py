@@ -0,0 +1,15 @@
+import logging
+from .base_task import BackgroundTask
+
+logger = logging.getLogger(__name__)
+
+class DatabaseMaintenanceTask(BackgroundTask):
+    """Task untuk WAL checkpoint dan PRAGMA optimize di luar jalur penulisan data"""
+    
+    def __init__(self, db_manager):
+        super().__init__(900, "DatabaseMaintenanceTask")  # 15 minutes
+        self.db_manager = db_manager
+        
+    def task(self):
+        """Jalankan checkpoint WAL dan optimize pada koneksi dari pool"""
+        self.db_manager.run_maintenance()
@@ -1,8 +1,10 @@
 import datetime
 import time
 import logging
+import multiprocessing
 import os
-from openpyxl import Workbook
+from concurrent.futures import ProcessPoolExecutor
+from services.excel_service import build_excel_report_from_path
 from .base_task import BackgroundTask
 
 logger = logging.getLogger(__name__)
@@ -30,16 +32,16 @@ class DailyExcelReportTask(BackgroundTask):
                 
                 logger.info(f"Laporan harian berikutnya dalam {seconds_to_wait / 3600:.2f} jam.")
                 
-                sleep_end_time = time.time() + seconds_to_wait
-                while time.time() < sleep_end_time and self.is_running:
-                    time.sleep(1)
+                if self.wait(seconds_to_wait):
+                    break
                 
                 if self.is_running:
                     self.task()
                     
             except Exception as e:
                 logger.error(f"Error di dalam loop {self.name}: {e}")
-                time.sleep(300)
+                if self.wait(300):
+                    break
     
     def task(self):
         """Generate daily Excel report untuk semua sistem"""
@@ -48,42 +50,26 @@ class DailyExcelReportTask(BackgroundTask):
         
         logger.info(f"Memulai pembuatan laporan Excel untuk tanggal: {yesterday_str}")
         
-        # Create workbook dengan multiple sheets
-        wb = Workbook()
-        systems = [
-            ("dryer", ["Waktu (WIB)", "Dryer 1 (°C)", "Dryer 2 (°C)", "Dryer 3 (°C)"]),
-            ("kedi", ["Waktu (WIB)", "Kedi 1 (°C)", "Kedi 2 (°C)"]),
-            ("boiler", ["Waktu (WIB)", "Boiler 1 (°C)", "Boiler 2 (°C)"])
-        ]
+        temp_dir = "/tmp" if os.path.exists("/tmp") else "."
+        filename = os.path.join(temp_dir, f"laporan_harian_{yesterday_str}.xlsx")
         
-        has_data = False
+        # Proses terpisah: serialisasi XML/zip openpyxl tidak menahan GIL proses utama,
+        # dan memorinya langsung dikembalikan ke OS saat proses selesai
+        try:
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+                row_counts = executor.submit(build_excel_report_from_path, self.db_manager.db_path, yesterday_str, filename).result()
+        except Exception as e:
+            logger.error(f"Gagal membuat laporan Excel untuk tanggal {yesterday_str}: {e}")
+            return
         
-        for i, (system, headers) in enumerate(systems):
-            if i == 0:
-                ws = wb.active
-                ws.title = f"Data {system.title()} {yesterday_str}"
-            else:
-                ws = wb.create_sheet(title=f"Data {system.title()} {yesterday_str}")
-            
-            rows = self.db_manager.get_data_by_date_pivoted(yesterday_str, table_type=system)
-            
-            ws.append(headers)
-            for row in rows:
-                ws.append(list(row))
-                
-            if rows:
-                has_data = True
-                logger.info(f"Data {system} untuk {yesterday_str}: {len(rows)} records")
+        for system, row_count in row_counts.items():
+            if row_count:
+                logger.info(f"Data {system} untuk {yesterday_str}: {row_count} records")
         
-        if not has_data:
+        if not any(row_counts.values()):
             logger.warning(f"Tidak ada data untuk dilaporkan pada tanggal {yesterday_str}.")
             return
         
-        # Save and send file
-        temp_dir = "/tmp" if os.path.exists("/tmp") else "."
-        filename = os.path.join(temp_dir, f"laporan_harian_{yesterday_str}.xlsx")
-        wb.save(filename)
-        
         caption = f"📊 *Laporan Harian Semua Sistem - {yesterday.strftime('%d %B %Y')}*"
         self.telegram_service.send_document(filename, caption)
         
@@ -11,13 +11,22 @@ class KeepaliveTask(BackgroundTask):
     def __init__(self, config):
         super().__init__(1800, "KeepaliveTask")  # 30 minutes
         self.config = config
+        app_name = os.getenv("FLY_APP_NAME", "")
+        self.keepalive_url = f"https://{app_name}.fly.dev/keepalive" if app_name else None
+        # Session dipakai ulang agar koneksi TCP/TLS tidak dibangun ulang setiap ping
+        self.session = requests.Session()
         
     def task(self):
         """Send keepalive request"""
-        app_url = os.getenv("FLY_APP_NAME", "")
-        if app_url:
+        if self.keepalive_url:
             try:
-                requests.get(f"https://{app_url}.fly.dev/keepalive", timeout=10)
+                # HEAD cukup untuk menjaga mesin tetap aktif; body tidak perlu ditransfer
+                self.session.head(self.keepalive_url, timeout=10, allow_redirects=False)
                 logger.info("Keepalive request sent successfully")
             except Exception as e:
-                logger.error(f"Keepalive error: {e}")
\ No newline at end of file
+                logger.error(f"Keepalive error: {e}")
+    
+    def stop(self):
+        """Stop task dan tutup HTTP session"""
+        super().stop()
+        self.session.close()
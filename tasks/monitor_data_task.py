@@ -25,15 +25,14 @@ class MonitorDataTask(BackgroundTask):
     
     def _check_system_error(self, system_type, since_time):
         """Check specific system for errors"""
-        rows = self.db_manager.get_data_since(since_time, system_type)
-        if not rows:
+        # Cukup jumlah/min/max dari SQLite; suhu macet berarti min == max
+        count, min_temp, max_temp = self.db_manager.get_temperature_stats_since(since_time, system_type)
+        if not count:
             return
         
-        unique_values = set([round(row[3], 2) for row in rows if len(row) > 3 and row[3] is not None])
-        
-        if len(unique_values) == 1:
+        if min_temp == max_temp:
             if not self.is_error_notified[system_type]:
-                suhu_error = list(unique_values)[0]
+                suhu_error = min_temp
                 error_message = f"⚠️ *PERINGATAN SISTEM ERROR - {system_type.upper()}* ⚠️\n\nSuhu macet di *{suhu_error:.2f}°C*."
                 self.telegram_service.send_message(error_message)
                 self.is_error_notified[system_type] = True
@@ -7,8 +7,15 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Interval minimum (detik) untuk menulis ulang session['last_activity']
+LAST_ACTIVITY_UPDATE_INTERVAL = 60
+
 def is_safe_url(target):
     """Validasi URL untuk mencegah open redirect vulnerability"""
+    # Fast path: path relatif ("/dwidaya?x=1") selalu ke host yang sama. "//host", backslash
+    # dan karakter kontrol ("/\host", "/\t/host" dibaca browser sebagai "//host") tetap lewat pemeriksaan penuh
+    if target.startswith('/') and not target.startswith('//') and '\\' not in target and target.isprintable():
+        return True
     ref_url = urlparse(request.host_url)
     test_url = urlparse(urljoin(request.host_url, target))
     return test_url.scheme in ('http', 'https') and ref_url.netloc == test_url.netloc
@@ -33,8 +40,9 @@ def check_session_timeout(f):
                     session.clear()  # Bersihkan semua session data
                     flash('Your session has expired after 24 hours. Please log in again.', 'warning')
                     return redirect(url_for('login'))
-                else:
-                    # Session masih valid, update last activity
+                elif current_time - session.get('last_activity', 0) > LAST_ACTIVITY_UPDATE_INTERVAL:
+                    # Session masih valid, update last activity (maksimal sekali per menit
+                    # agar cookie session tidak ditandatangani ulang di setiap request)
                     session['last_activity'] = current_time
             else:
                 # Tidak ada timestamp login, anggap session tidak valid
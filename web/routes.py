@@ -1,28 +1,144 @@
-from flask import render_template, request, jsonify, Response, redirect, url_for, flash, session
+from flask import render_template, request, Response, redirect, url_for, flash, session
 from flask_login import login_required, login_user, logout_user, current_user
-from werkzeug.security import check_password_hash
 from openpyxl import Workbook
-from io import BytesIO
-import json
+from services.excel_service import save_workbook, write_report_rows
+from itertools import chain
+import datetime
+import hashlib
+from tempfile import SpooledTemporaryFile
+import numpy as np
+import os
+import orjson
+import threading
 import time
 import logging
 from .auth import check_session_timeout, is_safe_url
 
 logger = logging.getLogger(__name__)
 
+# Header untuk SSE: jangan di-cache dan jangan di-buffer oleh reverse proxy
+SSE_HEADERS = {
+    'Cache-Control': 'no-cache',
+    'X-Accel-Buffering': 'no'
+}
+
+# SSE comment frame: menjaga koneksi tetap hidup tanpa memicu onmessage di browser
+SSE_PING = b": ping\n\n"
+# Interval ping SSE saat idle, di bawah idle timeout umum reverse proxy
+SSE_PING_INTERVAL = 15  # detik
+
+# Nama series dan warna Chart.js per sistem, dibangun sekali saat import
+CHART_SERIES_NAMES = {
+    "dryer": ("Dryer 1", "Dryer 2", "Dryer 3"),
+    "kedi": ("Kedi 1", "Kedi 2"),
+    "boiler": ("Boiler 1", "Boiler 2")
+}
+CHART_COLORS = (
+    ("rgba(255, 99, 132, 1)", "rgba(255, 99, 132, 0.2)"),
+    ("rgba(54, 162, 235, 1)", "rgba(54, 162, 235, 0.2)"),
+    ("rgba(75, 192, 192, 1)", "rgba(75, 192, 192, 0.2)"),
+)
+
+# Body /chart-data untuk tanggal tanpa data, di-encode sekali saat import
+EMPTY_CHART_BODY = orjson.dumps({"labels": [], "datasets": []})
+
 class WebRoutes:
     """Class untuk mengelola semua web routes"""
     
-    def __init__(self, config, db_manager, monitor_instance):
+    def __init__(self, config, db_manager, monitor_instance, limiter):
         self.config = config
         self.db_manager = db_manager
         self.monitor = monitor_instance
+        self.limiter = limiter
+        
+        # Cache body response per (endpoint, tanggal, sistem) / per halaman
+        self.chart_cache_ttl = 60  # detik
+        self.data_cache_ttl = 2  # detik
+        # Halaman dashboard tidak bergantung pada user/data (diisi lewat /data, /chart-data, SSE)
+        self.page_cache_ttl = 3600  # detik
+        # Data tanggal yang sudah lewat tidak berubah lagi, boleh di-cache jauh lebih lama
+        self.past_day_cache_ttl = 3600  # detik
+        self.response_cache_maxsize = 256
+        self._response_cache = {}
+        self._response_cache_lock = threading.Lock()
+        
+    def _get_cached_response(self, key):
+        """Ambil body (JSON/HTML) dari cache jika belum kedaluwarsa"""
+        now = time.monotonic()
+        with self._response_cache_lock:
+            entry = self._response_cache.get(key)
+            if entry and entry[0] > now:
+                return entry[1]
+        return None
+    
+    def _set_cached_response(self, key, body, ttl):
+        """Simpan body (JSON/HTML) ke cache dan buang entry yang sudah kedaluwarsa"""
+        now = time.monotonic()
+        with self._response_cache_lock:
+            for stale_key in [k for k, (expires, _) in self._response_cache.items() if expires <= now]:
+                del self._response_cache[stale_key]
+            if len(self._response_cache) >= self.response_cache_maxsize:
+                self._response_cache.clear()
+            self._response_cache[key] = (now + ttl, body)
+    
+    @staticmethod
+    def _is_valid_date(date_str):
+        """True jika date_str tanggal kalender valid dalam bentuk kanonik YYYY-MM-DD"""
+        try:
+            return datetime.date.fromisoformat(date_str).isoformat() == date_str
+        except (TypeError, ValueError):
+            return False
+    
+    def _is_past_date(self, date_str):
+        """True jika date_str tanggal valid yang sudah selesai (WIB); data tanggal tersebut tidak berubah lagi.
+        Tanggal kemarin baru dianggap selesai satu DATA_SAVE_INTERVAL setelah tengah malam"""
+        if not self._is_valid_date(date_str):
+            return False
+        settled = self.config.get_indonesia_time() - datetime.timedelta(seconds=self.config.DATA_SAVE_INTERVAL)
+        # Bentuk kanonik YYYY-MM-DD bisa dibandingkan sebagai string
+        return date_str < self.config.format_indonesia_date(settled)
+    
+    def _cache_ttl_for_date(self, date_str, ttl):
+        """TTL cache untuk data per tanggal: tanggal sebelum hari ini (WIB) memakai past_day_cache_ttl"""
+        if self._is_past_date(date_str):
+            return self.past_day_cache_ttl
+        return ttl
+    
+    @staticmethod
+    def _invalid_date_response(date_str):
+        """Response 400 untuk parameter ?date= yang bukan tanggal YYYY-MM-DD"""
+        return Response(orjson.dumps({"error": f"Tanggal tidak valid: {date_str!r}, gunakan format YYYY-MM-DD"}),
+                        status=400, mimetype='application/json')
+    
+    def _json_date_response(self, body, cache_key):
+        """Response JSON per tanggal: tanggal lampau memakai ETag (revalidasi -> 304), hari ini no-store"""
+        resp = Response(body, mimetype='application/json')
+        _, date_str, system_type = cache_key
+        if system_type in CHART_SERIES_NAMES and self._is_past_date(date_str):
+            # ETag dari hash isi body: otomatis berubah jika data atau format payload berubah (mis. setelah deploy).
+            # private: endpoint butuh login; no-cache: browser selalu revalidasi, body tidak dikirim ulang jika sama
+            resp.set_etag(hashlib.blake2b(body, digest_size=16).hexdigest())
+            resp.cache_control.private = True
+            resp.cache_control.no_cache = True
+            return resp.make_conditional(request)
+        resp.cache_control.no_store = True
+        return resp
+        
+    def _render_static_page(self, template_name, **context):
+        """Render halaman statis sekali lalu sajikan HTML dari cache"""
+        cache_key = ('page', template_name, tuple(sorted(context.items())))
+        html = self._get_cached_response(cache_key)
+        if html is None:
+            html = render_template(template_name, **context)
+            self._set_cached_response(cache_key, html, self.page_cache_ttl)
+        return html
         
     def register_routes(self, app):
         """Register semua routes ke Flask app"""
         
         # === Authentication Routes ===
         @app.route('/login', methods=['GET', 'POST'])
+        @self.limiter.limit("5/minute;20/hour", methods=['POST'])
         def login():
             if current_user.is_authenticated:
                 return redirect(url_for('index'))
@@ -32,7 +148,7 @@ class WebRoutes:
                 password = request.form['password']
                 user = self.db_manager.get_user_by_username(username)
                 
-                if user and check_password_hash(user.password, password):
+                if user and self.db_manager.verify_user_password(user, password):
                     login_user(user, remember=False)
                     session.permanent = True
                     session['login_timestamp'] = time.time()
@@ -55,6 +171,7 @@ class WebRoutes:
         @app.route('/logout')
         @login_required
         def logout():
+            self.db_manager.invalidate_user_cache(current_user.id)
             logout_user()
             flash('You have been logged out successfully.', 'info')
             return redirect(url_for('login'))
@@ -64,33 +181,33 @@ class WebRoutes:
         @login_required
         @check_session_timeout
         def index():
-            return render_template("index.html", active_page='dryer')
+            return self._render_static_page("index.html", active_page='dryer')
         
         @app.route("/dwidaya")
         @login_required
         @check_session_timeout
         def dwidaya():
-            with self.monitor.data_lock:
-                context = {
-                    "dryer_temps": self.monitor.latest_temperatures.get('dryer', {}),
-                    "kedi_temps": self.monitor.latest_temperatures.get('kedi', {}),
-                    "boiler_temps": self.monitor.latest_temperatures.get('boiler', {}),
-                    "current_time": self.config.format_indonesia_time(),
-                    "timezone": str(self.config.INDONESIA_TZ)
-                }
+            latest_temps = self.monitor.get_latest_temperatures()
+            context = {
+                "dryer_temps": latest_temps.get('dryer', {}),
+                "kedi_temps": latest_temps.get('kedi', {}),
+                "boiler_temps": latest_temps.get('boiler', {}),
+                "current_time": self.config.format_indonesia_time(),
+                "timezone": self.config.INDONESIA_TZ_NAME
+            }
             return render_template("dwidaya.html", **context)
         
         @app.route('/kedi')
         @login_required
         @check_session_timeout
         def kedi():
-            return render_template('navigation/kedi.html', active_page='kedi')
+            return self._render_static_page('navigation/kedi.html', active_page='kedi')
         
         @app.route('/boiler')
         @login_required
         @check_session_timeout
         def boiler():
-            return render_template('navigation/boiler.html', active_page='boiler')
+            return self._render_static_page('navigation/boiler.html', active_page='boiler')
         
         # === Data API Routes ===
         @app.route("/data")
@@ -98,6 +215,13 @@ class WebRoutes:
         def get_data_api():
             selected_date = request.args.get('date')
             system_type = request.args.get('type', 'dryer')  # default to dryer
+            if selected_date is not None and not self._is_valid_date(selected_date):
+                return self._invalid_date_response(selected_date)
+            
+            cache_key = ('data', selected_date, system_type)
+            cached = self._get_cached_response(cache_key)
+            if cached is not None:
+                return self._json_date_response(cached, cache_key)
             
             rows = self.db_manager.get_data_by_date_pivoted(selected_date, latest_only=True, table_type=system_type)
             
@@ -110,55 +234,47 @@ class WebRoutes:
                 data = [{"waktu": r[0], "boiler1": r[1], "boiler2": r[2]} for r in rows]
             else:
                 data = []
-                
-            return jsonify(data)
+            
+            body = orjson.dumps(data)
+            self._set_cached_response(cache_key, body, self._cache_ttl_for_date(selected_date, self.data_cache_ttl))
+            return self._json_date_response(body, cache_key)
         
         @app.route("/chart-data")
         @login_required
         def get_chart_data():
             try:
-                selected_date = request.args.get('date', self.config.get_indonesia_time().strftime('%Y-%m-%d'))
+                selected_date = request.args.get('date', self.config.format_indonesia_date())
                 system_type = request.args.get('type', 'dryer')
+                if not self._is_valid_date(selected_date):
+                    return self._invalid_date_response(selected_date)
+                
+                cache_key = ('chart', selected_date, system_type)
+                cached = self._get_cached_response(cache_key)
+                if cached is not None:
+                    return self._json_date_response(cached, cache_key)
                 
-                rows = self.db_manager.get_data_by_date_pivoted(selected_date, table_type=system_type)
+                # Label HH:MM langsung dari SQL, pivot per device juga sudah di SQL
+                rows = self.db_manager.get_data_by_date_pivoted(selected_date, table_type=system_type, time_format='%H:%M')
                 
                 if not rows:
-                    return jsonify({"labels": [], "datasets": []})
+                    return self._json_date_response(EMPTY_CHART_BODY, cache_key)
                 
-                labels = []
-                datasets_data = {}
+                series_names = CHART_SERIES_NAMES.get(system_type, ())
                 
-                for row in rows:
-                    waktu = row[0].split(' ')[1][:5]  # HH:MM
-                    labels.append(waktu)
-                    
-                    # Dynamic dataset creation based on system type
-                    if system_type == "dryer":
-                        datasets_data.setdefault("Dryer 1", []).append(row[1])
-                        datasets_data.setdefault("Dryer 2", []).append(row[2])
-                        datasets_data.setdefault("Dryer 3", []).append(row[3])
-                    elif system_type == "kedi":
-                        datasets_data.setdefault("Kedi 1", []).append(row[1])
-                        datasets_data.setdefault("Kedi 2", []).append(row[2])
-                    elif system_type == "boiler":
-                        datasets_data.setdefault("Boiler 1", []).append(row[1])
-                        datasets_data.setdefault("Boiler 2", []).append(row[2])
+                labels = [row[0] for row in rows]
                 
-                # Color mapping untuk chart
-                colors = [
-                    ("rgba(255, 99, 132, 1)", "rgba(255, 99, 132, 0.2)"),
-                    ("rgba(54, 162, 235, 1)", "rgba(54, 162, 235, 0.2)"),
-                    ("rgba(75, 192, 192, 1)", "rgba(75, 192, 192, 0.2)"),
-                ]
+                # Satu array float64 contiguous per device; NULL menjadi NaN (null di JSON)
+                values = np.array([row[1:] for row in rows], dtype=np.float64).T.copy()
+                datasets_data = dict(zip(series_names, values))
                 
                 datasets = []
                 for i, (label, data) in enumerate(datasets_data.items()):
-                    color_idx = i % len(colors)
+                    border_color, background_color = CHART_COLORS[i % len(CHART_COLORS)]
                     datasets.append({
                         "label": label,
                         "data": data,
-                        "borderColor": colors[color_idx][0],
-                        "backgroundColor": colors[color_idx][1],
+                        "borderColor": border_color,
+                        "backgroundColor": background_color,
                         "fill": True,
                         "tension": 0.4
                     })
@@ -167,65 +283,57 @@ class WebRoutes:
                     "labels": labels,
                     "datasets": datasets
                 }
-                return jsonify(chart_data)
+                body = orjson.dumps(chart_data, option=orjson.OPT_SERIALIZE_NUMPY)
+                self._set_cached_response(cache_key, body, self._cache_ttl_for_date(selected_date, self.chart_cache_ttl))
+                return self._json_date_response(body, cache_key)
                 
             except Exception as e:
                 logger.error(f"Error getting chart data: {e}")
-                return jsonify({"error": str(e)}), 500
+                return Response(orjson.dumps({"error": str(e)}), status=500, mimetype='application/json')
         
         # === Stream Routes ===
         @app.route("/stream-data")
         @login_required
         def stream_data():
             def generate_data():
+                last_seq = 0
                 try:
-                    while True:
-                        with self.monitor.data_lock:
-                            all_temps = self.monitor.latest_temperatures.copy()
-                        
-                        # Format semua data sistem
-                        data_payload = {}
-                        
-                        # Dryer data
-                        dryer_data = all_temps.get('dryer', {})
-                        for key, temp in dryer_data.items():
-                            data_payload[key] = f"{temp:.1f}" if temp is not None else "N/A"
-                        
-                        # Kedi data
-                        kedi_data = all_temps.get('kedi', {})
-                        for key, temp in kedi_data.items():
-                            data_payload[key] = f"{temp:.1f}" if temp is not None else "N/A"
-                        
-                        # Boiler data
-                        boiler_data = all_temps.get('boiler', {})
-                        for key, temp in boiler_data.items():
-                            data_payload[key] = f"{temp:.1f}" if temp is not None else "N/A"
-                        
-                        yield f"data: {json.dumps(data_payload)}\n\n"
-                        time.sleep(2)
+                    while not self.monitor.is_shutting_down():
+                        last_seq, payload = self.monitor.wait_stream_data(last_seq, timeout=SSE_PING_INTERVAL)
+                        if self.monitor.is_shutting_down():
+                            break
+                        if payload is None:
+                            # Nilai stabil: kirim ulang frame terakhir (bukan comment) agar onmessage
+                            # tetap jalan dan "Last update" di dashboard tidak terlihat beku
+                            payload = self.monitor.get_stream_payload() or SSE_PING
+                        yield payload
                         
                 except GeneratorExit:
                     logger.info("Koneksi stream data ditutup oleh klien.")
             
-            return Response(generate_data(), mimetype='text/event-stream')
+            return Response(generate_data(), mimetype='text/event-stream', headers=SSE_HEADERS)
         
         @app.route('/stream-notifications')
         @login_required
         def stream_notifications():
             def generate():
                 logger.info("[SSE Stream] Klien baru terhubung ke stream notifikasi.")
+                last_seq = self.monitor.get_notification_seq()
                 try:
-                    while True:
-                        try:
-                            notification = self.monitor.notification_queue.get(timeout=25)
-                            logger.info(f"[SSE Stream] MENGIRIM NOTIFIKASI KE KLIEN: {notification}")
-                            yield f"data: {json.dumps(notification)}\n\n"
-                        except:
-                            yield ": heartbeat\n\n"
+                    while not self.monitor.is_shutting_down():
+                        last_seq, frames = self.monitor.wait_notifications(last_seq, timeout=SSE_PING_INTERVAL)
+                        if not frames:
+                            if self.monitor.is_shutting_down():
+                                break
+                            yield SSE_PING
+                            continue
+                        for frame in frames:
+                            logger.info(f"[SSE Stream] MENGIRIM NOTIFIKASI KE KLIEN: {frame!r}")
+                            yield frame
                 except GeneratorExit:
                     logger.info("[SSE Stream] Klien terputus dari stream notifikasi.")
             
-            return Response(generate(), mimetype='text/event-stream')
+            return Response(generate(), mimetype='text/event-stream', headers=SSE_HEADERS)
         
         # === Download Routes ===
         @app.route("/download")
@@ -233,42 +341,50 @@ class WebRoutes:
         def download_excel():
             selected_date = request.args.get('date')
             system_type = request.args.get('type', 'dryer')
+            # Tanggal masuk ke header Content-Disposition, jadi harus tervalidasi
+            if not self._is_valid_date(selected_date) or system_type not in CHART_SERIES_NAMES:
+                return "Parameter date/type tidak valid.", 400
             
-            rows = self.db_manager.get_data_by_date_pivoted(selected_date, table_type=system_type)
-            if not rows: 
+            rows = self.db_manager.iter_data_by_date_pivoted(selected_date, table_type=system_type)
+            first_row = next(rows, None)
+            if first_row is None: 
                 return "Tidak ada data.", 404
             
-            wb = Workbook()
-            ws = wb.active
+            # Write-only workbook: baris langsung ditulis tanpa menyimpan cell object
+            wb = Workbook(write_only=True)
+            write_report_rows(wb, system_type, chain((first_row,), rows))
             
-            # Header berdasarkan sistem
-            if system_type == "dryer":
-                ws.append(["Waktu (WIB)", "Dryer 1 (°C)", "Dryer 2 (°C)", "Dryer 3 (°C)"])
-            elif system_type == "kedi":
-                ws.append(["Waktu (WIB)", "Kedi 1 (°C)", "Kedi 2 (°C)"])
-            elif system_type == "boiler":
-                ws.append(["Waktu (WIB)", "Boiler 1 (°C)", "Boiler 2 (°C)"])
-            
-            for row in rows: 
-                ws.append(list(row))
-            
-            buffer = BytesIO()
-            wb.save(buffer)
+            buffer = SpooledTemporaryFile(max_size=4 * 1024 * 1024)
+            save_workbook(wb, buffer)
+            # File sudah lengkap sebelum streaming: Content-Length agar browser bisa menampilkan progres
+            content_length = buffer.seek(0, os.SEEK_END)
             buffer.seek(0)
             
+            def stream_file():
+                try:
+                    while chunk := buffer.read(64 * 1024):
+                        yield chunk
+                finally:
+                    buffer.close()
+            
             filename = f"laporan_{system_type}_{selected_date}.xlsx"
-            return Response(buffer, 
+            return Response(stream_file(), 
                           mimetype='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet', 
-                          headers={'Content-Disposition': f'attachment;filename={filename}'})
+                          headers={
+                              'Content-Disposition': f'attachment;filename={filename}',
+                              'Content-Length': str(content_length),
+                              'X-Accel-Buffering': 'no'
+                          })
         
         # === Utility Routes ===
         @app.route("/keepalive")
         def keepalive():
-            return {"status": "alive", "timestamp": self.config.format_indonesia_time()}
+            payload = {"status": "alive", "timestamp": self.config.format_indonesia_time()}
+            return Response(orjson.dumps(payload), mimetype='application/json')
         
         @app.route("/test-telegram")
         @login_required
         def test_telegram():
             message = f"🧪 **Test Message**\n🕐 {self.config.format_indonesia_time()}"
             self.monitor.telegram_service.send_message(message)
-            return {"status": "success", "message": "Test message queued"}
\ No newline at end of file
+            return Response(orjson.dumps({"status": "success", "message": "Test message queued"}), mimetype='application/json')
\ No newline at end of file
@@ -0,0 +1,14 @@
+#!/usr/bin/env python3
+"""
+WSGI entry point untuk production server
+Jalankan dengan: gunicorn -c gunicorn.conf.py wsgi:app
+"""
+
+from core.monitor import TemperatureMonitor
+
+# Service dihentikan oleh hook gunicorn (lihat gunicorn.conf.py), bukan atexit:
+# atexit baru jalan setelah graceful_timeout habis menunggu stream SSE
+monitor = TemperatureMonitor()
+monitor.start_services()
+
+app = monitor.create_flask_app()